@@ -1042,6 +1042,9 @@ class OpDef:
         self.delete_on_success = data.get("delete-on-success") or False
         self.can_stage_trials = data.get("can-stage-trials") or False
         self.run_attrs = data.get("run-attrs")
+        # Plugins that provide default source code select rules for
+        # the op - set by `op_util` on first use
+        self.default_select_rules_plugins = None
 
     def __repr__(self):
         return f"<guild.guildfile.OpDef '{self.fullname}'>"
@@ -1209,11 +1212,35 @@ class FlagDef:
     def __repr__(self):
         return f"<guild.guildfile.FlagDef '{self.name}'>"
 
+    @property
+    def choices(self):
+        return self._choices
+
+    @choices.setter
+    def choices(self, choices):
+        self._choices = choices
+        self._choices_index = _flag_choices_index(choices)
+
 
 def _init_flag_values(flagdefs):
     return {flag.name: flag.default for flag in flagdefs}
 
 
+def _flag_choices_index(choices):
+    accepted = set()
+    by_key = {}
+    try:
+        for choice in choices or []:
+            if choice.alias:
+                accepted.add(choice.alias)
+            accepted.add(choice.value)
+            by_key.setdefault(choice.alias or choice.value, []).append(choice)
+    except TypeError:
+        return None
+    else:
+        return accepted, by_key
+
+
 def _init_flag_choices(data, flagdef):
     if not data:
         return []
@@ -1700,6 +1727,23 @@ def _notify_plugins_guildfile_loaded(guildfile):
         plugin.guildfile_loaded(guildfile)
 
 
+def flag_choices_index(flagdef):
+    """Returns a lookup index for flagdef choices.
+
+    The index is a tuple of `accepted, by_key`. `accepted` is a set of
+    the choice aliases and values. `by_key` maps each choice alias, or
+    value if the choice doesn't have an alias, to a list of matching
+    choices.
+
+    Returns None if a choice alias or value can't be used as a key,
+    in which case choices must be checked one by one.
+
+    The index is rebuilt when flagdef `choices` is set. It is not
+    updated when the choices list is modified in place.
+    """
+    return flagdef._choices_index
+
+
 def for_string(s, src="<string>"):
     data = yaml.safe_load(s)
     _notify_plugins_guildfile_data(data, src)
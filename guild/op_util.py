@@ -33,18 +33,19 @@ notes" in `guild.guildfile` module source code for additional thougts.
 """
 
 import csv
+import functools
 import importlib
 import io
 import logging
 import os
 import re
+import selectors
 import struct
+import subprocess
 import sys
 import threading
 import time
 
-import yaml
-
 from guild import _api
 from guild import config
 from guild import file_util
@@ -73,11 +74,32 @@ MAX_DEFAULT_SOURCECODE_COUNT = util.try_env("MAX_DEFAULT_SOURCECODE_COUNT", int)
 MAIN_EXEC = "${python_exe} -um guild.op_main ${main_args} -- ${flag_args}"
 STEPS_EXEC = "${guild_python_exe} -um guild.steps_main"
 
-LABEL_TOKENS_P = re.compile(r"(\${.+?})")
+# Alternatives are tried in order: operation, model and operation,
+# package model and operation, and package and operation.
+OPSPEC_P = re.compile(
+    r"(?P<op>[^/:]+)$"
+    r"|(?P<model>[^/:]*):(?P<model_op>[^/:]+)$"
+    r"|(?P<pkg_model>[^/:]*/[^/:?]*):(?P<pkg_model_op>[^/:]+)$"
+    r"|(?P<pkg>[^/:]+/):?(?P<pkg_op>[^/:]+)$"
+)
+_OPSPEC_MODEL_GROUPS = {
+    "op": None,
+    "model_op": "model",
+    "pkg_model_op": "pkg_model",
+    "pkg_op": "pkg",
+}
+
+# Alternatives must be kept in sync with refs in `_apply_other_args()`
+EXEC_ARG_REF_P = re.compile(r"\${(project_dir)}")
+
 LABEL_FLAG_REF_P = re.compile(r"\${(.+?)}")
 
 RUN_OUTPUT_STREAM_BUFFER = 4096
 
+RUN_OUTPUT_NON_PRINTABLE = bytes(range(9))
+
+RUN_OUTPUT_INDEX_ENTRY = struct.Struct("!QB")
+
 RESTART_NEEDED_STATUS = ("pending",)
 
 DEFAULT_PROC_POLL_INTERVAL = 5
@@ -95,6 +117,8 @@ RUN_PROTO_ATTRS = [
 
 NoCurrentRun = _api.NoCurrentRun
 
+_opdef_cache = {}
+
 ###################################################################
 # Error classes
 ###################################################################
@@ -249,9 +273,12 @@ class RunOutput:
     def open(self, proc):
         """Opens output.
 
-        When open, threads are started for reading from proc.stdout
-        and proc.stderr and writing to sys.stdout and sys.stderr
-        respectively.
+        When open, output is read from proc.stdout and proc.stderr and
+        written to sys.stdout and sys.stderr respectively.
+
+        On POSIX systems a single thread multiplexes reads from both
+        process streams. Otherwise a thread is started for each
+        stream.
 
         Generates an error if run output is closed.
 
@@ -262,11 +289,15 @@ class RunOutput:
         self._proc = proc
         self._output = self._open_output()
         self._index = self._open_index()
-        self._out_tee = threading.Thread(target=self._out_tee_run)
-        self._out_tee.start()
-        if proc.stderr:
-            self._err_tee = threading.Thread(target=self._err_tee_run)
-            self._err_tee.start()
+        if proc.stderr and _select_tee_supported():
+            self._out_tee = threading.Thread(target=self._select_tee_run)
+            self._out_tee.start()
+        else:
+            self._out_tee = threading.Thread(target=self._out_tee_run)
+            self._out_tee.start()
+            if proc.stderr:
+                self._err_tee = threading.Thread(target=self._err_tee_run)
+                self._err_tee.start()
         self._open = True
 
     def _assert_closed(self):
@@ -295,50 +326,91 @@ class RunOutput:
         self._gen_tee_run(self._proc.stderr, sys.stderr, 1)
 
     def _gen_tee_run(self, input_stream, output_stream, stream_type):
+        os_read = os.read
+        input_fileno = input_stream.fileno()
+        tee = self._stream_tee(output_stream, stream_type)
+        while True:
+            buf = os_read(input_fileno, RUN_OUTPUT_STREAM_BUFFER)
+            tee(buf)
+            if not buf:
+                break
+
+    def _select_tee_run(self):
+        assert self._proc
+        os_read = os.read
+        sel = selectors.DefaultSelector()
+        sel.register(
+            self._proc.stdout, selectors.EVENT_READ, self._stream_tee(sys.stdout, 0)
+        )
+        sel.register(
+            self._proc.stderr, selectors.EVENT_READ, self._stream_tee(sys.stderr, 1)
+        )
+        try:
+            while sel.get_map():
+                for key, _events in sel.select():
+                    buf = os_read(key.fd, RUN_OUTPUT_STREAM_BUFFER)
+                    key.data(buf)
+                    if not buf:
+                        sel.unregister(key.fileobj)
+        finally:
+            sel.close()
+
+    def _stream_tee(self, output_stream, stream_type):
+        """Returns a function that handles bytes read from a stream.
+
+        The function writes each buffer it's called with to
+        `output_stream` (unless quiet), the run output, and the run
+        output index. An empty buffer indicates the end of the stream.
+        """
         assert self._output
         assert self._index
-        os_read = os.read
         os_write = os.write
-        input_fileno = input_stream.fileno()
-        if not self._quiet and hasattr(output_stream, "fileno"):
-            try:
-                stream_fileno = output_stream.fileno()
-            except io.UnsupportedOperation:
-                stream_fileno = None
-        else:
-            stream_fileno = None
+        stream_fileno = None if self._quiet else _stream_fileno(output_stream)
         output_fileno = self._output.fileno()
         index_fileno = self._index.fileno()
         lock = self._output_lock
-        line = []
-        while True:
-            buf = os_read(input_fileno, RUN_OUTPUT_STREAM_BUFFER)
+        line = bytearray()
+
+        def tee(buf):
             if not buf:
                 if line:
-                    self._output_eol(index_fileno, line, stream_type)
-                break
+                    os_write(index_fileno, self._output_eol(line, stream_type))
+                return
             with lock:
                 if stream_fileno is not None:
                     os_write(stream_fileno, buf)
                 os_write(output_fileno, buf)
-                for b in buf:
-                    if b < 9:  # non-printable
-                        continue
-                    line.append(b)
-                    if b == 10:  # LF
-                        self._output_eol(index_fileno, line, stream_type)
-                        del line[:]
-
-    def _output_eol(self, index_fileno, line, stream_type):
-        line_bytes = bytes(line)
-        entry = struct.pack("!QB", int(time.time() * 1000), stream_type)
-        os.write(index_fileno, entry)
+                # Scrub non-printable bytes and split on LF in bulk
+                # rather than scanning buf one byte at a time
+                parts = buf.translate(None, RUN_OUTPUT_NON_PRINTABLE).split(b"\n")
+                index_entries = []
+                for part in parts[:-1]:
+                    line.extend(part)
+                    line.extend(b"\n")
+                    index_entries.append(self._output_eol(line, stream_type))
+                    line.clear()
+                line.extend(parts[-1])
+                if index_entries:
+                    # One index write per read rather than one per line
+                    os_write(index_fileno, b"".join(index_entries))
+
+        return tee
+
+    def _output_eol(self, line, stream_type):
+        """Handles the end of an output line.
+
+        Returns the index entry for the line. The caller is
+        responsible for writing the entry to the output index.
+        """
+        entry = _pack_index_entry(time.time_ns() // 1000000, stream_type)
         if self._output_cb:
             try:
-                self._output_cb.write(line_bytes)
+                # Callbacks get an immutable copy of the line buffer
+                self._output_cb.write(bytes(line))
             except Exception:
                 log.exception("error in output callback (will be removed)")
                 self._output_cb = None
+        return entry
 
     def wait(self):
         """Wait for run output reader threads to exit.
@@ -361,7 +433,7 @@ class RunOutput:
         assert self._output
         assert self._index
         assert self._out_tee
-        assert not self._proc.stderr or self._err_tee
+        assert not self._proc.stderr or self._err_tee or _select_tee_supported()
 
     def close(self):
         lock = self._acquire_output_lock()
@@ -371,13 +443,9 @@ class RunOutput:
             lock.release()
 
     def _acquire_output_lock(self, timeout=60):
-        """Polling verison of acquire to support timeouts on Python 2."""
-        timeout_at = time.time() + timeout
-        while time.time() < timeout_at:
-            if self._output_lock.acquire(False):
-                return self._output_lock
-            time.sleep(1)
-        raise RuntimeError("timeout")
+        if not self._output_lock.acquire(timeout=timeout):
+            raise RuntimeError("timeout")
+        return self._output_lock
 
     def _close(self):
         self._assert_open()
@@ -402,12 +470,48 @@ class RunOutput:
         self.close()
 
 
+_pack_index_entry = RUN_OUTPUT_INDEX_ENTRY.pack
+
+
+def _select_tee_supported():
+    # Windows pipes can't be used with select
+    return util.get_platform() != "Windows"
+
+
+def _stream_fileno(stream):
+    if not hasattr(stream, "fileno"):
+        return None
+    try:
+        return stream.fileno()
+    except io.UnsupportedOperation:
+        return None
+
+
 ###################################################################
 # OpDef for spec
 ###################################################################
 
 
 def opdef_for_opspec(opspec):
+    """Returns the opdef for an op spec.
+
+    Opdefs are cached by opspec, Guild's current directory, and the
+    model path.
+    """
+    cache_key = (
+        opspec,
+        os.path.abspath(config.cwd()),
+        tuple(_modellib().get_path()),
+    )
+    try:
+        return _opdef_cache[cache_key]
+    except KeyError:
+        opdef = _opdef_for_opspec(opspec)
+        _opdef_cache[cache_key] = opdef
+        return opdef
+
+
+def _opdef_for_opspec(opspec):
     try:
         return _model_opdef(opspec)
     except OpDefLookupError:
@@ -488,50 +592,16 @@ def _model_parent_paths(modeldef):
 ###################################################################
 
 
+@functools.lru_cache(maxsize=512)
 def parse_opspec(spec):
-    return util.find_apply(
-        [
-            _empty_spec,
-            _op_spec,
-            _model_op_spec,
-            _package_model_op_spec,
-            _package_op_spec,
-        ],
-        spec,
-    )
-
-
-def _empty_spec(spec):
-    if spec:
-        return None
-    return None, None
-
-
-def _op_spec(spec):
-    if "/" in spec or ":" in spec:
-        return None
-    return None, spec
-
-
-def _model_op_spec(spec):
-    m = re.match(r"([^/:]*):([^/:]+)$", spec)
-    if not m:
-        return None
-    return m.groups()
-
-
-def _package_model_op_spec(spec):
-    m = re.match(r"([^/:]*/[^/:?]*):([^/:]+)$", spec)
-    if not m:
-        return None
-    return m.groups()
-
-
-def _package_op_spec(spec):
-    m = re.match(r"([^/:]+/):?([^/:]+)$", spec)
+    if not spec:
+        return None, None
+    m = OPSPEC_P.match(spec)
     if not m:
         return None
-    return m.groups()
+    op_group = m.lastgroup
+    model_group = _OPSPEC_MODEL_GROUPS[op_group]
+    return m.group(model_group) if model_group else None, m.group(op_group)
 
 
 def _resolve_model(model_ref):
@@ -545,8 +615,7 @@ def _resolve_model(model_ref):
 
 
 def _resolve_cwd_model(model_ref):
-    from guild import model as modellib  # expensive
-
+    modellib = _modellib()
     cwd_guildfile = _cwd_guildfile()
     if not cwd_guildfile:
         return None
@@ -554,6 +623,17 @@ def _resolve_cwd_model(model_ref):
         return _match_one_model(model_ref, cwd_guildfile)
 
 
+def _modellib():
+    """Returns `guild.model`, which is imported on first use."""
+    try:
+        return globals()["__modellib"]
+    except KeyError:
+        from guild import model as modellib  # expensive
+
+        globals()["__modellib"] = modellib
+        return modellib
+
+
 def _cwd_guildfile():
     try:
         return guildfile.for_dir(config.cwd())
@@ -577,9 +657,7 @@ def _match_one_model(model_ref, cwd_guildfile=None):
 
 
 def _iter_matching_models(model_ref, cwd_guildfile):
-    from guild import model as modellib  # expensive
-
-    for model in modellib.iter_models():
+    for model in _modellib().iter_models():
         if model_ref:
             if _match_model_ref(model_ref, model):
                 yield model
@@ -698,9 +776,12 @@ def set_run_staged(run):
 
 def run_label(label_template, flag_vals):
     """Returns a run label for template and flag vals."""
-    default_label = _default_run_label(flag_vals)
     if label_template is None:
-        return default_label
+        return _default_run_label(flag_vals)
+    # Only format the default label when the template can refer to it
+    default_label = (
+        _default_run_label(flag_vals) if "default_label" in label_template else None
+    )
     return _render_label_template(label_template, flag_vals, default_label)
 
 
@@ -725,21 +806,37 @@ def _render_label_template(label_template, flag_vals, default_label):
     which may be referenced using the name 'default_label' in the
     template.
     """
-    formatted_vals = _render_template_formatted_vals(flag_vals, default_label)
+    formatted_vals = _FormattedVals(flag_vals, default_label)
     return _render_label_template_formatted(label_template, formatted_vals)
 
 
-def _render_template_formatted_vals(flag_vals, default_label):
-    formatted_vals = {
-        "default_label": default_label,
-    }
-    formatted_vals.update(
-        {
-            name: FormattedValue(val)
-            for name, val in flag_vals.items() if val is not None
-        }
-    )
-    return formatted_vals
+class _FormattedVals:
+    """Map of names to formatted values for a label template.
+
+    Non-null flag values are wrapped as `FormattedValue` on first
+    lookup. Templates typically refer to a few flags so this avoids
+    wrapping every flag value.
+    """
+
+    def __init__(self, flag_vals, default_label):
+        self._flag_vals = flag_vals
+        self._default_label = default_label
+        self._formatted = {}
+
+    def get(self, name):
+        try:
+            return self._formatted[name]
+        except KeyError:
+            formatted = self._formatted[name] = self._formatted_val(name)
+            return formatted
+
+    def _formatted_val(self, name):
+        val = self._flag_vals.get(name)
+        if val is not None:
+            return FormattedValue(val)
+        if name == "default_label":
+            return self._default_label
+        return None
 
 
 class FormattedValue:
@@ -758,31 +855,36 @@ class FormattedValue:
 
     def __str__(self):
         if self._str is None:
-            self._str = flag_util.format_flag(
-                self._value, truncate_floats=True, shorten_paths=True
-            )
+            self._str = _format_label_val(self._value)
         return self._str
 
 
+def _format_label_val(val):
+    if type(val) is int:  # pylint: disable=unidiomatic-typecheck
+        # Same as format_flag (excluding bools) without YAML encoding
+        return str(val)
+    return flag_util.format_flag(val, truncate_floats=True, shorten_paths=True)
+
+
 def _render_label_template_formatted(label_template, formatted_vals):
     """Renders a label template with formatted values.
 
-    `formatted_vals` is a map of names to formatted values. A
-    formatted value is a value wrapped as a `FormattedValue` instance.
+    `formatted_vals` is a map of names to formatted values that
+    supports `get()`. A formatted value is a value wrapped as a
+    `FormattedValue` instance.
 
     This function supports value filters in form
     ``${NAME|FILTER:ARG1,ARG2}``, which require values to be be
     wrapped with `FormattedValue`.
     """
-    tokens = LABEL_TOKENS_P.split(label_template)
-    return "".join([_rendered_str(_render_token(t, formatted_vals)) for t in tokens])
+    return LABEL_FLAG_REF_P.sub(
+        lambda m: _rendered_str(_render_ref(m.group(1), formatted_vals)),
+        label_template,
+    )
 
 
-def _render_token(token, vals):
-    m = LABEL_FLAG_REF_P.match(token)
-    if not m:
-        return token
-    ref_parts = m.group(1).split("|")
+def _render_ref(ref, vals):
+    ref_parts = ref.split("|")
     name = ref_parts[0]
     transforms = ref_parts[1:]
     val = vals.get(name)
@@ -801,16 +903,13 @@ def _apply_template_transform(t, val):
         name, arg = parts
     if name[:1] == "%":
         return _t_python_format(val, name)
-    if name == "default":
-        return _t_default(val, arg)
-    if name == "basename":
-        if arg:
-            log.warning("ignoring argment to baseline in %r", t)
-        return _t_basename(val)
-    if name == "unquote":
-        return _t_unquote(val)
-    log.warning("unsupported template transform: %r", t)
-    return "#error#"
+    try:
+        transform = _LABEL_TRANSFORMS[name]
+    except KeyError:
+        log.warning("unsupported template transform: %r", t)
+        return "#error#"
+    else:
+        return transform(val, arg)
 
 
 def _t_python_format(val, fmt):
@@ -833,18 +932,27 @@ def _t_default(val, arg):
     return val
 
 
-def _t_basename(val):
+def _t_basename(val, arg):
+    if arg:
+        log.warning("ignoring argument to basename: %r", arg)
     if not val:
         return ""
     return os.path.basename(util.strip_trailing_sep(val))
 
 
-def _t_unquote(val):
+def _t_unquote(val, _arg):
     if isinstance(val, str) and len(val) >= 2 and val[0] == "'" and val[-1] == "'":
         return val[1:-1]
     return val
 
 
+_LABEL_TRANSFORMS = {
+    "default": _t_default,
+    "basename": _t_basename,
+    "unquote": _t_unquote,
+}
+
+
 def _rendered_str(s):
     if s is None:
         return ""
@@ -945,6 +1053,12 @@ def _plugin_default_select_rules(opdef):
 
 
 def _plugins_for_default_select_rules(opdef):
+    if opdef.default_select_rules_plugins is None:
+        opdef.default_select_rules_plugins = _plugins_for_default_select_rules_(opdef)
+    return opdef.default_select_rules_plugins
+
+
+def _plugins_for_default_select_rules_(opdef):
     from guild import plugin as pluginlib
 
     return sorted(
@@ -1095,7 +1209,12 @@ def _op_cmd_args_and_run_attrs(opdef):
 def split_cmd(cmd):
     if isinstance(cmd, list):
         return cmd
-    return util.shlex_split(cmd or "")
+    return list(_split_cmd_str(cmd or ""))
+
+
+@functools.lru_cache(maxsize=256)
+def _split_cmd_str(cmd):
+    return tuple(util.shlex_split(cmd))
 
 
 def _opdef_exec_and_run_attrs(opdef):
@@ -1127,33 +1246,50 @@ def _run_attrs_for_steps(opdef):
 
 def _apply_main_args(main_args, exec_args):
     i = 0
-    while i < len(exec_args):
-        if exec_args[i] == "${main_args}":
+    while True:
+        try:
+            i = exec_args.index("${main_args}", i)
+        except ValueError:
+            break
+        else:
             exec_args[i:i + 1] = main_args
             i += len(main_args)
-        i += 1
 
 
 def _apply_flag_args_marker(exec_args):
-    for i, val in enumerate(exec_args):
-        if val == "${flag_args}":
+    i = 0
+    while True:
+        try:
+            i = exec_args.index("${flag_args}", i)
+        except ValueError:
+            break
+        else:
             exec_args[i] = "__flag_args__"
+            i += 1
 
 
 def _apply_other_args(args, opdef):
-    repl = [
-        ("${project_dir}", opdef.guildfile.dir),
-    ]
+    repl = {
+        "project_dir": opdef.guildfile.dir,
+    }
+
+    def repl_ref(m):
+        return repl[m.group(1)] or m.group(0)
+
     for i, val in enumerate(args):
-        for pattern, text in repl:
-            if val and text:
-                args[i] = val.replace(pattern, text)
+        if not val or "${" not in val:
+            continue
+        replaced, count = EXEC_ARG_REF_P.subn(repl_ref, val)
+        if count:
+            args[i] = replaced
 
 
 def _op_cmd_env(opdef, extra_env):
-    env = dict(opdef.env or {})
-    env.update(extra_env or {})
-    env["PROJECT_DIR"] = opdef.guildfile.dir or ""
+    env = {
+        **(opdef.env or {}),
+        **(extra_env or {}),
+        "PROJECT_DIR": opdef.guildfile.dir or "",
+    }
     if opdef.flags_dest:
         env["FLAGS_DEST"] = opdef.flags_dest
     if opdef.handle_keyboard_interrupt:
@@ -1210,14 +1346,17 @@ def flag_vals_for_opdef(opdef, user_flag_vals=None, force=False):
 
     """
     flag_vals = dict(user_flag_vals)
-    normalize_flag_aliases(opdef.flags, flag_vals, force)
-    _apply_default_flag_vals(opdef.flags, flag_vals)
-    _apply_coerce_flag_vals(opdef.flags, force, flag_vals)
+    flagdefs = opdef.flags
+    flagdef_lookup = {flagdef.name: flagdef for flagdef in flagdefs}
+    split_parts = {}
+    normalize_flag_aliases(flagdefs, flag_vals, force)
+    _apply_default_flag_vals(flagdefs, flag_vals)
+    _apply_coerce_flag_vals(flagdef_lookup, force, flag_vals, split_parts)
     if not force:
-        _check_no_such_flags(flag_vals, opdef.flags)
-        _check_flag_vals(flag_vals, opdef.flags)
-        _check_required_flags(flag_vals, opdef.flags)
-    _apply_choice_vals(opdef.flags, user_flag_vals, flag_vals)
+        _check_no_such_flags(flag_vals, flagdef_lookup)
+        _check_flag_vals(flag_vals, flagdefs, split_parts)
+        _check_required_flags(flag_vals, flagdefs)
+    _apply_choice_vals(flagdefs, user_flag_vals, flag_vals)
     return flag_vals
 
 
@@ -1235,26 +1374,23 @@ def normalize_flag_aliases(flagdefs, flag_vals, force=False):
     If an alias is the same as the name, the entry in flag vals is not
     modified.
     """
+    if not flag_vals:
+        return
     for flagdef in flagdefs:
-        if not flagdef.alias or flagdef.alias == flagdef.name:
+        alias = flagdef.alias
+        if not alias or alias == flagdef.name or alias not in flag_vals:
             continue
-        if flagdef.alias in flag_vals and flagdef.name in flag_vals:
+        if flagdef.name in flag_vals:
             if not force:
-                raise AliasAndNameSpecifiedError(flagdef.name, flagdef.alias)
+                raise AliasAndNameSpecifiedError(flagdef.name, alias)
             continue
-        try:
-            val = flag_vals.pop(flagdef.alias)
-        except KeyError:
-            pass
-        else:
-            flag_vals[flagdef.name] = val
+        flag_vals[flagdef.name] = flag_vals.pop(alias)
 
 
-def _apply_coerce_flag_vals(flagdefs, force, vals):
-    flagdef_lookup = {flagdef.name: flagdef for flagdef in flagdefs}
+def _apply_coerce_flag_vals(flagdef_lookup, force, vals, split_parts=None):
     for name, val in vals.items():
         try:
-            coerced = _coerced_flag_value(name, val, flagdef_lookup)
+            coerced = _coerced_flag_value(name, val, flagdef_lookup, split_parts)
         except InvalidFlagValue:
             if not force:
                 raise
@@ -1262,18 +1398,25 @@ def _apply_coerce_flag_vals(flagdefs, force, vals):
             vals[name] = coerced
 
 
-def _coerced_flag_value(name, val, flagdefs):
+def _coerced_flag_value(name, val, flagdefs, split_parts=None):
     flagdef = flagdefs.get(name)
     if not flagdef:
         return val
     try:
-        return coerce_flag_value(val, flagdef)
+        return _coerce_flag_value(val, flagdef, split_parts)
     except (ValueError, TypeError) as e:
         raise InvalidFlagValue(val, flagdef, str(e)) from e
 
 
 def coerce_flag_value(val, flagdef):
     """Coerces a flag value based on flagdef settings."""
+    return _coerce_flag_value(val, flagdef)
+
+
+def _coerce_flag_value(val, flagdef, split_parts=None):
+    # If split_parts is a dict, coerced parts of split flag values are
+    # saved there by flag name and joined value so that checks don't
+    # need to split the joined value again.
     if (
         val is None  #
         or not flagdef  #
@@ -1283,44 +1426,90 @@ def coerce_flag_value(val, flagdef):
     ):
         return val
     if isinstance(val, list):
-        return [coerce_flag_value(x, flagdef) for x in val]
+        return [_coerce_flag_value(x, flagdef, split_parts) for x in val]
     if flagdef.arg_split:
-        return _coerce_flag_val_split_parts(val, flagdef)
+        return _coerce_flag_val_split_parts(val, flagdef, split_parts)
     return _coerce_typed_flag_value(val, flagdef)
 
 
 def _coerce_typed_flag_value(val, flagdef):
     assert flagdef.type is not None
-    if flagdef.type == "string":
-        return _try_coerce_flag_val(val, str, flagdef)
-    if flagdef.type == "int":
-        if isinstance(val, float):
-            raise ValueError("invalid value for type 'int'")
-        return _try_coerce_flag_val(val, int, flagdef)
-    if flagdef.type == "float":
+    try:
+        coerce = _FLAG_TYPE_COERCE[flagdef.type]
+    except KeyError:
+        log.warning(
+            "unknown flag type '%s' for %s - cannot coerce",
+            flagdef.type,
+            flagdef.name,
+        )
+        return val
+    else:
+        return coerce(val, flagdef)
+
+
+def _coerce_string(val, flagdef):
+    return _try_coerce_flag_val(val, str, flagdef)
+
+
+def _coerce_int(val, flagdef):
+    if type(val) is int:  # pylint: disable=unidiomatic-typecheck
+        return val
+    if isinstance(val, float):
+        raise ValueError("invalid value for type 'int'")
+    return _try_coerce_flag_val(val, int, flagdef)
+
+
+def _coerce_float(val, flagdef):
+    if type(val) is float:  # pylint: disable=unidiomatic-typecheck
+        return val
+    return _try_coerce_flag_val(val, float, flagdef)
+
+
+def _coerce_boolean(val, flagdef):
+    return _try_coerce_flag_val(val, bool, flagdef)
+
+
+def _coerce_number(val, flagdef):
+    if isinstance(val, (float, int)):
+        return val
+    if isinstance(val, str) and not _maybe_int_str(val):
         return _try_coerce_flag_val(val, float, flagdef)
-    if flagdef.type == "boolean":
-        return _try_coerce_flag_val(val, bool, flagdef)
-    if flagdef.type == "number":
-        if isinstance(val, (float, int)):
-            return val
-        return _try_coerce_flag_val(val, (int, float), flagdef)
-    if flagdef.type in ("path", "existing-path"):
-        return _resolve_rel_path(val)
-    log.warning(
-        "unknown flag type '%s' for %s - cannot coerce",
-        flagdef.type,
-        flagdef.name,
-    )
-    return val
+    return _try_coerce_flag_val(val, (int, float), flagdef)
+
+
+def _maybe_int_str(s):
+    """Returns False if `int(s)` is certain to fail for string s.
+
+    Used to skip an int conversion attempt (and the exception it
+    raises) for values like '1.5' and '1e-3'.
+    """
+    return s.strip().lstrip("+-").replace("_", "").isdecimal()
+
+
+def _coerce_path(val, _flagdef):
+    return _resolve_rel_path(val)
 
 
-def _coerce_flag_val_split_parts(val, flagdef):
+_FLAG_TYPE_COERCE = {
+    "string": _coerce_string,
+    "int": _coerce_int,
+    "float": _coerce_float,
+    "boolean": _coerce_boolean,
+    "number": _coerce_number,
+    "path": _coerce_path,
+    "existing-path": _coerce_path,
+}
+
+
+def _coerce_flag_val_split_parts(val, flagdef, split_parts=None):
     assert flagdef.type is not None
     encoded = _ensure_encoded_flag_val(val)
     parts = flag_util.split_encoded_flag_val(encoded, flagdef.arg_split)
     coerced = [_coerce_typed_flag_value(part, flagdef) for part in parts]
-    return flag_util.join_splittable_flag_vals(coerced, flagdef.arg_split)
+    joined = flag_util.join_splittable_flag_vals(coerced, flagdef.arg_split)
+    if split_parts is not None:
+        split_parts[(flagdef.name, joined)] = coerced
+    return joined
 
 
 def _ensure_encoded_flag_val(val):
@@ -1341,7 +1530,8 @@ def _try_coerce_flag_val(val, funs, flagdef):
 
 
 def _resolve_rel_path(val):
-    val = os.path.expanduser(val)
+    if not isinstance(val, str) or val.startswith("~"):
+        val = os.path.expanduser(val)
     if val and not os.path.isabs(val):
         return os.path.abspath(val)
     return val
@@ -1365,40 +1555,47 @@ def _required_operation_name(resdef):
     return None
 
 
-def _check_no_such_flags(flag_vals, flagdefs):
-    flagdef_names = {flagdef.name for flagdef in flagdefs}
+def _check_no_such_flags(flag_vals, flagdef_lookup):
     for name in flag_vals:
-        if name not in flagdef_names:
+        if name not in flagdef_lookup:
             raise NoSuchFlagError(name)
 
 
-def _check_flag_vals(vals, flagdefs):
+def _check_flag_vals(vals, flagdefs, split_parts=None):
     for flag in flagdefs:
         val = vals.get(flag.name)
-        _check_flag_val(val, flag)
+        _check_flag_val(val, flag, split_parts)
 
 
-def _check_flag_val(val, flagdef):
+def _check_flag_val(val, flagdef, split_parts=None):
     if isinstance(val, list):
         for x in val:
-            _check_flag_val(x, flagdef)
+            _check_flag_val(x, flagdef, split_parts)
     elif flagdef.arg_split and val is not None:
-        _check_splittable_flag_val(val, flagdef)
+        _check_splittable_flag_val(val, flagdef, split_parts)
     else:
         _check_flag_val_(val, flagdef)
 
 
-def _check_splittable_flag_val(val, flagdef):
+def _check_splittable_flag_val(val, flagdef, split_parts=None):
     assert flagdef.arg_split is not None
-    encoded = _ensure_encoded_flag_val(val)
-    split_val = [
-        flag_util.decode_flag_val(part)
-        for part in flag_util.split_encoded_flag_val(encoded, flagdef.arg_split)
-    ]
+    split_val = _coerced_split_parts(val, flagdef, split_parts)
+    if split_val is None:
+        encoded = _ensure_encoded_flag_val(val)
+        split_val = [
+            flag_util.decode_flag_val(part)
+            for part in flag_util.split_encoded_flag_val(encoded, flagdef.arg_split)
+        ]
     for x in split_val:
         _check_flag_val_(x, flagdef)
 
 
+def _coerced_split_parts(val, flagdef, split_parts):
+    if not split_parts or not isinstance(val, str):
+        return None
+    return split_parts.get((flagdef.name, val))
+
+
 def _check_flag_val_(val, flagdef):
     if flag_util.is_flag_function(val):
         return
@@ -1410,12 +1607,24 @@ def _check_flag_val_(val, flagdef):
 def _check_flag_choice(val, flag):
     if not val or flag.allow_other or not flag.choices:
         return
+    if not _is_flag_choice(val, flag):
+        raise InvalidFlagChoice(val, flag)
+
+
+def _is_flag_choice(val, flag):
+    index = guildfile.flag_choices_index(flag)
+    if index:
+        accepted, _by_key = index
+        try:
+            return val in accepted
+        except TypeError:
+            pass
     for choice in flag.choices:
         if choice.alias and val == choice.alias:
-            return
+            return True
         if choice.value == val:
-            return
-    raise InvalidFlagChoice(val, flag)
+            return True
+    return False
 
 
 def _check_flag_type(val, flag):
@@ -1440,15 +1649,24 @@ def _apply_choice_vals(flagdefs, user_vals, target_vals):
         flag_val = target_vals.get(flagdef.name)
         if flag_val is None:
             continue
-        for choice in flagdef.choices:
-            if (choice.alias or choice.value) != flag_val:
-                continue
+        for choice in _matching_flag_choices(flag_val, flagdef):
             if choice.alias:
                 target_vals[flagdef.name] = choice.value
             if choice.flags:
                 _apply_choice_flags(choice.flags, user_vals, target_vals)
 
 
+def _matching_flag_choices(val, flag):
+    index = guildfile.flag_choices_index(flag)
+    if index:
+        _accepted, by_key = index
+        try:
+            return by_key.get(val, ())
+        except TypeError:
+            pass
+    return [choice for choice in flag.choices if (choice.alias or choice.value) == val]
+
+
 def _apply_choice_flags(choice_flags, user_vals, target_vals):
     for flag_name, flag_val in choice_flags.items():
         if user_vals.get(flag_name) is None:
@@ -1464,16 +1682,10 @@ def _check_required_flags(vals, flagdefs):
 def _missing_flags(vals, flagdefs):
     return [
         flag for flag in flagdefs
-        if flag.required and _flag_missing(vals.get(flag.name))
+        if flag.required and vals.get(flag.name) in (None, "")
     ]
 
 
-def _flag_missing(val):
-    if val is None or val == "":
-        return True
-    return False
-
-
 def _apply_default_flag_vals(flagdefs, flag_vals):
     """Applies default values to flag_vals.
 
@@ -1486,10 +1698,11 @@ def _apply_default_flag_vals(flagdefs, flag_vals):
 
 
 def flag_assigns(flags, skip_none=False):
-    return [
-        flag_assign(name, val) for name, val in sorted(flags.items())
-        if not skip_none or val is not None
-    ]
+    items = flags.items()
+    if skip_none:
+        items = [(name, val) for name, val in items if val is not None]
+    format_flag = flag_util.format_flag
+    return [f"{name}={format_flag(val)}" for name, val in sorted(items)]
 
 
 def flag_assign(name, val):
@@ -1498,7 +1711,9 @@ def flag_assign(name, val):
 
 
 def parse_flag_assigns(args, opdef=None):
-    expanded_args = [os.path.expanduser(arg) for arg in args]
+    expanded_args = [
+        os.path.expanduser(arg) if arg.startswith("~") else arg for arg in args
+    ]
     flagdefs = opdef.flags if opdef else None
     parsed_flags = {}
     parse_errors = {}
@@ -1551,13 +1766,14 @@ def args_to_flags(args):
     """
     flags = {}
     flag_args, other_args = split_args_for_flags(args)
+    decode = yaml_util.decode_yaml
     name = None
     for arg in flag_args:
         if arg[:2] == "--":
             _maybe_switch(flags, name)
             name = arg[2:]
         elif arg[:1] == "-":
-            maybe_num = yaml_util.decode_yaml(arg)
+            maybe_num = decode(arg)
             if isinstance(maybe_num, (int, float)):
                 _set_or_append_flag(flags, name, maybe_num)
             elif len(arg) == 2:
@@ -1568,7 +1784,7 @@ def args_to_flags(args):
                 name = arg[1]
                 _set_or_append_flag(flags, name, arg[2:])
         elif name is not None:
-            _set_or_append_flag(flags, name, yaml_util.decode_yaml(arg))
+            _set_or_append_flag(flags, name, decode(arg))
         else:
             other_args.append(arg)
     _maybe_switch(flags, name)
@@ -1599,10 +1815,12 @@ def split_args_for_flags(args):
 
     If `arg` does not contain `--` returns `args, []`.
     """
-    for i in range(len(args) - 1, -1, -1):
-        if args[i] == "--":
-            return args[i + 1:], args[:i]
-    return args, []
+    try:
+        i = len(args) - 1 - args[::-1].index("--")
+    except ValueError:
+        return args, []
+    else:
+        return args[i + 1:], args[:i]
 
 
 def global_dest(global_name, flags):
@@ -1687,7 +1905,8 @@ def _read_trials(path):
 
 def _yaml_trials(path):
     try:
-        data = yaml.safe_load(open(path, "r"))
+        with open(path, "r") as f:
+            data = yaml_util.safe_load(f)
     except Exception as e:
         raise BatchFileError(path, str(e)) from e
     else:
@@ -1712,17 +1931,18 @@ def _coerce_trials_data(data, path):
 
 
 def _csv_trials(path):
-    reader = csv.reader(open(path, "r"))
-    try:
-        flag_names = next(reader)
-    except StopIteration:
-        return []
-    else:
-        return [dict(zip(flag_names, _flag_vals(row))) for row in reader]
-
-
-def _flag_vals(row):
-    return [flag_util.decode_flag_val(s) for s in row]
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        try:
+            flag_names = next(reader)
+        except StopIteration:
+            return []
+        else:
+            decode = flag_util.decode_flag_val
+            return [
+                {name: decode(s) for name, s in zip(flag_names, row)}
+                for row in reader
+            ]
 
 
 ###################################################################
@@ -1764,34 +1984,25 @@ def restart_needed(run, flags):
     return run.status in RESTART_NEEDED_STATUS or run.get("flags") != flags
 
 
-def run_params_for_restart(run, user_specified_params=None):
-    """Returns params for use in run command for a restart of run.
-
-    The set of applicable params in the run "run_params" attribute are
-    considered. If user_specified_params contains a non-default value
-    (i.e. the user has indicated she wants to use a specific value)
-    that param will not be included in the result. If
-    user_specified_params is None (default) then all applicable params
-    for a restart that are defined in run are returned.
-    """
-    # Note about applicable run params:
-    #
-    # A limited number of params could possibly apply to args - those
-    # are listed here. This list has to be maintained as new args are
-    # added to the run command. Params must be included where the user
-    # would reasonably assume applicability and never in cases where
-    # the use of the parameter would be clearly surprising to the user
-    # (e.g. reusing the 'yes' param, which would alter the expected
-    # behavior of the command on a restart).
-    #
-    # Params that are saved as run attrs or otherwise available under
-    # the run guild path (e.g. opspec, label, flags) should NOT be
-    # returned in this value in the interest of elimiting redundancy
-    # and potential mismtach bugs. Anyone needing those values MUST
-    # read them via run attrs or applicable run interface
-    # (e.g. opref in the case of opsec).
-    #
-    applicable_run_params = [
+# Note about applicable run params:
+#
+# A limited number of params could possibly apply to args - those
+# are listed here. This list has to be maintained as new args are
+# added to the run command. Params must be included where the user
+# would reasonably assume applicability and never in cases where
+# the use of the parameter would be clearly surprising to the user
+# (e.g. reusing the 'yes' param, which would alter the expected
+# behavior of the command on a restart).
+#
+# Params that are saved as run attrs or otherwise available under
+# the run guild path (e.g. opspec, label, flags) should NOT be
+# returned in this value in the interest of elimiting redundancy
+# and potential mismtach bugs. Anyone needing those values MUST
+# read them via run attrs or applicable run interface
+# (e.g. opref in the case of opsec).
+#
+_APPLICABLE_RUN_PARAMS = frozenset(
+    [
         "force_flags",
         "gpus",
         "max_trials",
@@ -1802,6 +2013,19 @@ def run_params_for_restart(run, user_specified_params=None):
         "optimizer",
         "random_seed",
     ]
+)
+
+
+def run_params_for_restart(run, user_specified_params=None):
+    """Returns params for use in run command for a restart of run.
+
+    The set of applicable params in the run "run_params" attribute are
+    considered. If user_specified_params contains a non-default value
+    (i.e. the user has indicated she wants to use a specific value)
+    that param will not be included in the result. If
+    user_specified_params is None (default) then all applicable params
+    for a restart that are defined in run are returned.
+    """
     from guild.commands.run import run as run_cmd
 
     run_params = run.get("run_params", {})
@@ -1810,9 +2034,9 @@ def run_params_for_restart(run, user_specified_params=None):
     baseline_params = run_cmd.make_context("", []).params
     result = {}
     for name in run_params:
-        val = _coerce_run_param(name, run_params[name])
-        if name not in applicable_run_params:
+        if name not in _APPLICABLE_RUN_PARAMS:
             continue
+        val = _coerce_run_param(name, run_params[name])
         if user_specified_params is None:
             result[name] = val
             continue
@@ -1842,33 +2066,37 @@ def _coerce_run_param(name, val):
 def wait_for_proc(p, stop_after_min, poll_interval=None, kill_delay=None):
     poll_interval = poll_interval or DEFAULT_PROC_POLL_INTERVAL
     kill_delay = kill_delay or DEFAULT_PROC_KILL_DELAY
-    started = time.time()
-    stop_at = time.time() + stop_after_min * 60
-    while time.time() < stop_at:
-        returncode = p.poll()
-        if returncode is not None:
-            return returncode
-        time.sleep(poll_interval)
-    elapsed = (time.time() - started) / 60
+    started = time.monotonic()
+    try:
+        return p.wait(timeout=stop_after_min * 60)
+    except subprocess.TimeoutExpired:
+        pass
+    elapsed = (time.monotonic() - started) / 60
     log.info("Stopping process early (pid %i) - %.1f minute(s) elapsed", p.pid, elapsed)
     return _terminate(p, poll_interval, kill_delay)
 
 
 def _terminate(p, poll_interval, kill_delay):
-    kill_at = time.time() + kill_delay
     p.terminate()
-    while p.poll() is None and time.time() < kill_at:
-        time.sleep(poll_interval)
-    if p.poll() is None:
+    try:
+        p.wait(timeout=kill_delay)
+    except subprocess.TimeoutExpired:
         log.warning("Process did not terminate (pid %i), killing", p.pid)
         p.kill()
-        time.sleep(poll_interval)
+        _wait_for_proc_exit(p, poll_interval)
     returncode = p.poll()
     if returncode not in (0, -15):
         raise ProcessError(f"Process did not terminate gracefully (pid {p.pid})")
     return returncode
 
 
+def _wait_for_proc_exit(p, timeout):
+    try:
+        p.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        pass
+
+
 ###################################################################
 # Other utils
 ###################################################################
@@ -1981,12 +2209,6 @@ def _os_env():
 
 
 def _remove_duplicate_paths(paths):
-    # Tedious but intentional
-    seen = set()
-    result = []
-    for path in paths:
-        if path in seen:
-            continue
-        seen.add(path)
-        result.append(path)
-    return result
+    # Dicts preserve insertion order so this keeps the first occurrence
+    # of each path
+    return list(dict.fromkeys(paths))
@@ -12,18 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import hashlib
+import json
 import logging
 import os
+import re
 
 from guild import guildfile
 from guild import op_util
 from guild import plugin as pluginlib
 from guild import util
+from guild import var
+from guild import yaml_util
 
 from . import flags_import_util
 
 log = logging.getLogger("guild")
 
+JSON_START_P = re.compile(rb"\s*[\[{]")
+
+# Increment when the format of cached flags data changes
+FLAGS_DATA_CACHE_VERSION = 1
+
+_flags_data_cache = {}
+
 
 class _ConfigNotSupported(Exception):
     def __str__(self):
@@ -35,13 +48,18 @@ class ConfigFlagsPlugin(pluginlib.Plugin):
     def guildfile_loaded(self, gf):
         for m in gf.models.values():
             for opdef in m.operations:
-                apply_config_flags(opdef)
+                config_src = _config_src(opdef)
+                if config_src:
+                    _apply_config_flags(opdef, config_src)
 
 
 def apply_config_flags(opdef):
     config_src = _config_src(opdef)
-    if not config_src:
-        return
+    if config_src:
+        _apply_config_flags(opdef, config_src)
+
+
+def _apply_config_flags(opdef, config_src):
     flags_import_util.apply_flags(opdef, lambda: _flags_data(config_src))
     _ensure_config_dep(config_src, opdef)
 
@@ -53,14 +71,94 @@ def _config_src(opdef):
 
 
 def _flags_data(src):
-    data = _load_flags(src)
+    """Returns flags data for config src.
+
+    Flags data is cached by src path, modified time, and size both in
+    memory and on disk (see `_disk_cached_flags_data`). Callers are
+    given a copy of cached data.
+    """
+    cache_key = _flags_data_cache_key(src)
+    if cache_key is None:
+        return _load_flags_data(src)
+    try:
+        cached = _flags_data_cache[cache_key]
+    except KeyError:
+        cached = _flags_data_cache[cache_key] = _disk_cached_flags_data(
+            src, cache_key
+        )
+    return {name: dict(flag_data) for name, flag_data in cached.items()}
+
+
+def _flags_data_cache_key(src):
+    try:
+        st = os.stat(src)
+    except OSError:
+        return None
+    else:
+        return os.path.abspath(src), st.st_mtime_ns, st.st_size
+
+
+def _disk_cached_flags_data(src, cache_key):
+    """Returns flags data for src using a disk cache.
+
+    The cache saves parsing config files for each Guild command. Set
+    `NO_CONFIG_FLAGS_CACHE=1` to disable the cache.
+
+    Data with non-string flag names is not cached as JSON would
+    convert the names to strings.
+    """
+    if os.getenv("NO_CONFIG_FLAGS_CACHE") == "1":
+        return _load_flags_data(src)
+    abs_src, mtime_ns, size = cache_key
+    cache_path = _flags_data_cache_path(abs_src)
+    stat_key = [FLAGS_DATA_CACHE_VERSION, mtime_ns, size]
+    data = _read_flags_data_cache(cache_path, stat_key)
+    if data is None:
+        data = _load_flags_data(src)
+        if all(isinstance(name, str) for name in data):
+            _write_flags_data_cache(data, stat_key, cache_path)
+    return data
+
+
+def _flags_data_cache_path(abs_src):
+    hashed = hashlib.md5(abs_src.encode()).hexdigest()
+    return os.path.join(var.cache_dir("config-flags"), hashed)
+
+
+def _read_flags_data_cache(path, stat_key):
+    try:
+        with open(path, "r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get("stat") != stat_key:
+        return None
+    return cached.get("data")
+
+
+def _write_flags_data_cache(data, stat_key, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        util.ensure_dir(os.path.dirname(path))
+        with open(tmp_path, "w") as f:
+            json.dump({"stat": stat_key, "data": data}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.debug("error writing config flags cache %s: %s", path, e)
+        util.ensure_deleted(tmp_path)
+
+
+def _load_flags_data(src):
+    flag_data_for_val = flags_import_util.flag_data_for_val
     return {
-        name: flags_import_util.flag_data_for_val(val)
-        for name, val in data.items() if _is_legal_flag_val(val)
+        name: flag_data_for_val(val)
+        for name, val in _load_flags(src)
+        if type(val) in _LEGAL_FLAG_VAL_TYPES
     }
 
 
 def _load_flags(src):
+    """Returns a list of `(name, val)` for flags defined in src."""
     ext = _flags_src_ext(src)
     if ext in (".yaml", ".yml"):
         return _load_flags_yaml(src)
@@ -71,6 +169,7 @@ def _load_flags(src):
     raise _ConfigNotSupported(src)
 
 
+@functools.lru_cache(maxsize=256)
 def _flags_src_ext(src):
     ext = os.path.splitext(src)[1].lower()
     if ext == ".in":
@@ -79,28 +178,59 @@ def _flags_src_ext(src):
 
 
 def _load_flags_yaml(src):
-    import yaml
+    with open(src, "rb") as f:
+        s = f.read()
+    data = _try_decode_json(s) if JSON_START_P.match(s) else None
+    if data is None:
+        data = yaml_util.safe_load(s)
+    return _flattened_keyvals(data)
 
-    data = yaml.safe_load(open(src))
-    return dict(_iter_keyvals(data))
 
+def _try_decode_json(s):
+    """Returns s decoded as JSON or None if s isn't valid JSON.
+
+    JSON is a subset of YAML and is much faster to parse. JSON
+    constants (NaN, Infinity) aren't allowed as YAML decodes these as
+    strings.
+    """
+    try:
+        return json.loads(s, parse_constant=_json_constant_error)
+    except ValueError:
+        return None
 
-def _iter_keyvals(data):
+
+def _json_constant_error(name):
+    raise ValueError(name)
+
+
+def _flattened_keyvals(data):
+    """Returns a list of `(name, val)` for nested dict data.
+
+    Names of nested values are joined with '.'. Values are listed in
+    depth-first order.
+    """
+    keyvals = []
     if not isinstance(data, dict):
-        return
-    for basename, val in data.items():
-        if isinstance(val, dict):
-            for name, val in _iter_keyvals(val):
-                yield ".".join([basename, name]), val
+        return keyvals
+    stack = [(None, iter(data.items()))]
+    while stack:
+        prefix, items = stack[-1]
+        for name, val in items:
+            if prefix is not None:
+                name = ".".join([prefix, name])
+            if isinstance(val, dict):
+                stack.append((name, iter(val.items())))
+                break
+            keyvals.append((name, val))
         else:
-            yield basename, val
+            stack.pop()
+    return keyvals
 
 
 def _load_flags_json(src):
-    import json
-
-    data = json.load(open(src))
-    return dict(_iter_keyvals(data))
+    with open(src, "rb") as f:
+        data = json.loads(f.read())
+    return _flattened_keyvals(data)
 
 
 def _load_flags_cfg(src):
@@ -108,16 +238,16 @@ def _load_flags_cfg(src):
 
     config = configparser.ConfigParser(default_section=None)
     config.read(src)
-    data = {}
-    for section in config.sections():
-        for name in config.options(section):
-            val = util.decode_cfg_val(config.get(section, name))
-            data[f"{section}.{name}"] = val
-    return data
+    return [
+        (f"{section}.{name}", util.decode_cfg_val(val))
+        for section in config.sections()
+        for name, val in config.items(section)
+    ]
 
 
-def _is_legal_flag_val(val):
-    return val is None or isinstance(val, (str, int, float, bool, list))
+# Config values are loaded by YAML, JSON, and config parsers, which
+# create these builtin types and not subclasses of them.
+_LEGAL_FLAG_VAL_TYPES = frozenset([type(None), str, int, float, bool, list])
 
 
 def _ensure_config_dep(config_src, opdef):
@@ -130,6 +260,8 @@ def _ensure_config_dep(config_src, opdef):
 
 
 def _find_config_res_source(opdef, config_src):
+    if not opdef.dependencies:
+        return None
     config_source_uri = f"config:{config_src}"
     for resdef in op_util.iter_opdef_resources(opdef):
         for source in resdef.sources:
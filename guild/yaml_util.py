@@ -17,6 +17,11 @@ import re
 
 import yaml
 
+try:
+    _SafeLoader = yaml.CSafeLoader
+except AttributeError:
+    _SafeLoader = yaml.SafeLoader
+
 
 def encode_yaml(val, default_flow_style=False, strict=False):
     """Returns val encoded as YAML.
@@ -52,6 +57,15 @@ def decode_yaml(s):
         raise ValueError(e) from e
 
 
+def safe_load(stream):
+    """Loads YAML from stream using the safe loader.
+
+    Uses the libyaml based loader when PyYAML is built with libyaml
+    support, otherwise uses the pure Python loader.
+    """
+    return yaml.load(stream, Loader=_SafeLoader)
+
+
 def yaml_front_matter(filename):
     fm_s = _yaml_front_matter_s(filename)
     if not fm_s: